@@ -0,0 +1,91 @@
+"""Track completed lessons per enrollment as a bitset
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+
+Adds Course.lesson_count, Lesson.bit_index and the enrollment bitset, gives
+existing lessons bit indexes in course order and carries completed
+enrollments over as having every lesson done. Enrollment.progress is now
+derived from the bitset count and is dropped.
+
+Statements use IF [NOT] EXISTS so databases already created by create_all
+with the current models upgrade cleanly too.
+"""
+from alembic import op
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE courses ADD COLUMN IF NOT EXISTS lesson_count INTEGER")
+    op.execute("ALTER TABLE lessons ADD COLUMN IF NOT EXISTS bit_index INTEGER")
+    op.execute("ALTER TABLE enrollments ADD COLUMN IF NOT EXISTS completed_lessons BYTEA")
+    op.execute("ALTER TABLE enrollments ADD COLUMN IF NOT EXISTS completed_lesson_count INTEGER")
+
+    # Existing lessons, numbered per course after any index already handed out
+    op.execute("""
+        UPDATE lessons SET bit_index = numbered.bit_index
+        FROM (
+            SELECT lessons.id,
+                   coalesce(courses.lesson_count, 0) - 1 + row_number() OVER (
+                       PARTITION BY sections.course_id
+                       ORDER BY sections.order_index, sections.id, lessons.order_index, lessons.id
+                   ) AS bit_index
+            FROM lessons
+            JOIN sections ON sections.id = lessons.section_id
+            JOIN courses ON courses.id = sections.course_id
+            WHERE lessons.bit_index IS NULL
+        ) AS numbered
+        WHERE lessons.id = numbered.id
+    """)
+    op.execute("""
+        UPDATE courses SET lesson_count = coalesce((
+            SELECT max(lessons.bit_index) + 1
+            FROM lessons JOIN sections ON sections.id = lessons.section_id
+            WHERE sections.course_id = courses.id
+        ), 0)
+    """)
+
+    # Completed enrollments get every current lesson's bit (bit N is byte
+    # N / 8, bit N % 8 from the least significant end); the rest start empty
+    op.execute("""
+        UPDATE enrollments
+        SET completed_lesson_count = courses.lesson_count,
+            completed_lessons = decode(
+                repeat('ff', courses.lesson_count / 8)
+                || CASE WHEN mod(courses.lesson_count, 8) > 0
+                        THEN lpad(to_hex((1 << mod(courses.lesson_count, 8)) - 1), 2, '0')
+                        ELSE '' END,
+                'hex')
+        FROM courses
+        WHERE courses.id = enrollments.course_id
+          AND enrollments.status = 'completed'
+          AND enrollments.completed_lessons IS NULL
+    """)
+    op.execute("""
+        UPDATE enrollments SET completed_lessons = ''::bytea, completed_lesson_count = 0
+        WHERE completed_lessons IS NULL
+    """)
+
+    op.execute("ALTER TABLE enrollments DROP COLUMN IF EXISTS progress")
+
+
+def downgrade():
+    op.execute("ALTER TABLE enrollments ADD COLUMN IF NOT EXISTS progress DOUBLE PRECISION")
+    op.execute("""
+        UPDATE enrollments
+        SET progress = least(coalesce(enrollments.completed_lesson_count, 0) * 100.0
+                             / nullif(courses.lesson_count, 0), 100.0)
+        FROM courses
+        WHERE courses.id = enrollments.course_id
+    """)
+    op.execute("UPDATE enrollments SET progress = 0 WHERE progress IS NULL")
+    op.execute("ALTER TABLE enrollments DROP COLUMN IF EXISTS completed_lesson_count")
+    op.execute("ALTER TABLE enrollments DROP COLUMN IF EXISTS completed_lessons")
+    op.execute("ALTER TABLE lessons DROP COLUMN IF EXISTS bit_index")
+    op.execute("ALTER TABLE courses DROP COLUMN IF EXISTS lesson_count")
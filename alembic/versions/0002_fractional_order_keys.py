@@ -0,0 +1,60 @@
+"""Order sections and lessons by fractional keys
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+
+Adds order_key to sections and lessons, gives every existing row a key that
+keeps its order_index order, and indexes (parent, order_key, id) so ordered
+reads come straight from the index.
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+TABLES = (("sections", "course_id"), ("lessons", "section_id"))
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def _digit(value: str, place: int) -> str:
+    return f"substr('{DIGITS}', mod(({value}) / {62 ** place}, 62)::int + 1, 1)"
+
+
+def _backfill_keys(table: str, parent: str):
+    # Same spacing as utils.ordering.spread_keys at a fixed width of four
+    # digits: the i-th of n siblings gets i * 62^4 / (n + 1), without
+    # trailing zeros. Parents with missing keys are respaced in full,
+    # keyed rows first.
+    value = "position * 14776336 / (siblings + 1)"
+    key = " || ".join(_digit(value, place) for place in (3, 2, 1, 0))
+    op.execute(f"""
+        UPDATE {table} SET order_key = rtrim({key}, '0')
+        FROM (
+            SELECT id,
+                   row_number() OVER (
+                       PARTITION BY {parent} ORDER BY order_key NULLS LAST, order_index, id
+                   )::bigint AS position,
+                   count(*) OVER (PARTITION BY {parent})::bigint AS siblings
+            FROM {table}
+            WHERE {parent} IN (SELECT {parent} FROM {table} WHERE order_key IS NULL)
+        ) AS numbered
+        WHERE {table}.id = numbered.id
+    """)
+
+
+def upgrade():
+    for table, parent in TABLES:
+        op.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS order_key VARCHAR COLLATE "C"')
+        _backfill_keys(table, parent)
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_{parent}_order_key")
+        op.execute(f"CREATE INDEX ix_{table}_{parent}_order_key ON {table} ({parent}, order_key, id)")
+
+
+def downgrade():
+    for table, parent in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_{parent}_order_key")
+        op.execute(f"ALTER TABLE {table} DROP COLUMN IF EXISTS order_key")
@@ -1,10 +1,13 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine
-from . import models
-from .routers import auth, course, content, enrollment
+from . import models, metrics, profiling, recommendations
+from .tasks import task_queue
+from .routers import auth, course, content, enrollment, profiling as profiling_router
 
-# Create database tables
+# Create database tables. create_all only adds missing tables; columns added
+# to existing tables come from the migrations, run with `alembic upgrade head`
 models.Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="LMS API")
@@ -18,12 +21,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in per-request profiles and the runtime sampler; a header scan when unused
+app.add_middleware(profiling.ProfilingMiddleware)
+
+# Outermost middleware, so latency includes everything below it
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.install_process_metrics()
+
 # Include routers here later
 app.include_router(auth.router)
 app.include_router(course.router)
 app.include_router(content.router)
 app.include_router(enrollment.router)
+app.include_router(profiling_router.router)
+
+@app.on_event("startup")
+async def install_profiling_executor():
+    # Sync routes run in the default executor; tag its calls with their request
+    profiling.install(asyncio.get_running_loop())
+
+@app.on_event("startup")
+async def start_task_queue():
+    await task_queue.start()
+
+@app.on_event("startup")
+async def start_recommendation_refresh():
+    # First iteration queues the initial build
+    app.state.recommendation_refresh = asyncio.get_running_loop().create_task(
+        recommendations.refresh_periodically()
+    )
+
+@app.on_event("shutdown")
+async def stop_recommendation_refresh():
+    app.state.recommendation_refresh.cancel()
+
+@app.on_event("shutdown")
+async def stop_task_queue():
+    # Let queued follow-up work finish before the process exits
+    await task_queue.stop()
 
 @app.get("/")
 def read_root():
-    return {"message": "Welcome to LMS API"}
\ No newline at end of file
+    return {"message": "Welcome to LMS API"}
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # async so the collectors run on the event loop and can inspect its executor
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
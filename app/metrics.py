@@ -0,0 +1,273 @@
+import asyncio
+import collections
+import gc
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Minimal Prometheus-compatible metrics. Updates come from the event loop,
+# threadpool threads (task enqueues) and whichever thread triggers a GC, so
+# every read-modify-write takes the metric's lock; uncontended that costs far
+# less than the rest of the request path.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+GC_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+_metrics = []
+_collectors: List[Callable[[], None]] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            snapshot = list(self._values.items())
+        for labels, value in snapshot:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, labels: Tuple[str, ...] = ()):
+        self._values[labels] = value
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        # [per-bucket counts (last one is +Inf), sum]
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bucket] += 1
+            state[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_str} {cumulative}")
+        return lines
+
+
+def register_collector(collector: Callable[[], None]):
+    """Register a callback that refreshes gauges right before each scrape."""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    for collector in _collectors:
+        collector()
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# HTTP metrics
+
+REQUESTS = Counter("http_requests_total", "Total HTTP requests.", ("method", "route", "status"))
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route"), LATENCY_BUCKETS
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size.", ("method", "route"), SIZE_BUCKETS
+)
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.", ("method",))
+
+UNMATCHED_ROUTE = "<unmatched>"
+# Any other request method is reported as OTHER so clients can't create series
+KNOWN_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+_route_templates = None
+
+
+def route_template(scope) -> str:
+    """Path template of the route that handled scope (once routing has run)."""
+    # The router stores the matched endpoint in the scope; map it back to the
+    # route's path template, building the lookup once on first use
+    global _route_templates
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    if _route_templates is None:
+        app = scope.get("app")
+        _route_templates = {
+            route.endpoint: route.path
+            for route in getattr(app, "routes", ())
+            if hasattr(route, "endpoint")
+        }
+    return _route_templates.get(endpoint, UNMATCHED_ROUTE)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and body size per route template.
+
+    Labels use the matched route's path template (e.g. /courses/{course_id})
+    rather than the raw path, so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        if method not in KNOWN_METHODS:
+            method = "OTHER"
+        in_flight_labels = (method,)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc(in_flight_labels)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec(in_flight_labels)
+            labels = (method, route_template(scope))
+            REQUEST_LATENCY.observe(elapsed, labels)
+            RESPONSE_SIZE.observe(size, labels)
+            REQUESTS.inc(labels + (str(status_code),))
+
+
+# Process metrics
+
+RESIDENT_MEMORY = Gauge("process_resident_memory_bytes", "Resident memory size in bytes.")
+CPU_SECONDS = Gauge("process_cpu_seconds_total", "Total user and system CPU time in seconds.")
+GC_PAUSE = Histogram("python_gc_pause_seconds", "Garbage collection pause duration.", ("generation",), GC_BUCKETS)
+THREADPOOL_MAX = Gauge("threadpool_max_workers", "Maximum threads in the default executor.")
+THREADPOOL_THREADS = Gauge("threadpool_threads", "Threads started by the default executor.")
+THREADPOOL_QUEUED = Gauge("threadpool_queued_tasks", "Calls waiting for a free executor thread.")
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_gc_start = None
+# (generation, seconds) pairs. The GC callback may fire while any thread holds
+# a metric lock (including GC_PAUSE's own), so it only appends here and the
+# pauses are folded into GC_PAUSE at scrape time.
+_gc_pauses = collections.deque(maxlen=100_000)
+
+
+def _on_gc(phase, info):
+    global _gc_start
+    if phase == "start":
+        _gc_start = time.perf_counter()
+    elif _gc_start is not None:
+        _gc_pauses.append((str(info["generation"]), time.perf_counter() - _gc_start))
+        _gc_start = None
+
+
+def _collect_process():
+    while _gc_pauses:
+        generation, seconds = _gc_pauses.popleft()
+        GC_PAUSE.observe(seconds, (generation,))
+
+    try:
+        with open("/proc/self/statm") as f:
+            RESIDENT_MEMORY.set(int(f.read().split()[1]) * _PAGE_SIZE)
+    except OSError:
+        try:
+            import resource
+        except ImportError:
+            resource = None
+        if resource is not None:
+            # Peak rather than current RSS; ru_maxrss is bytes on macOS, KiB elsewhere
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            RESIDENT_MEMORY.set(maxrss if sys.platform == "darwin" else maxrss * 1024)
+    times = os.times()
+    CPU_SECONDS.set(times.user + times.system)
+
+    # Sync routes run in the loop's default ThreadPoolExecutor; a non-empty
+    # work queue means every thread is busy and requests are waiting
+    try:
+        executor = asyncio.get_running_loop()._default_executor
+    except (RuntimeError, AttributeError):
+        executor = None
+    if executor is not None:
+        THREADPOOL_MAX.set(executor._max_workers)
+        THREADPOOL_THREADS.set(len(executor._threads))
+        THREADPOOL_QUEUED.set(executor._work_queue.qsize())
+
+
+def install_process_metrics():
+    if _on_gc not in gc.callbacks:
+        gc.callbacks.append(_on_gc)
+    if _collect_process not in _collectors:
+        register_collector(_collect_process)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, DateTime, Text, Table
+from sqlalchemy import Boolean, Column, Integer, String, Float, ForeignKey, DateTime, Text, Table, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -38,12 +38,13 @@ class Course(Base):
     level = Column(String)  # beginner, intermediate, advanced
     status = Column(String, default="draft")  # draft, published, archived
     thumbnail_url = Column(String, nullable=True)
+    lesson_count = Column(Integer, default=0)  # Cached number of lessons, also the next free bit index
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
     users = relationship("User", secondary=user_course, back_populates="courses")
-    sections = relationship("Section", back_populates="course", cascade="all, delete-orphan")
+    sections = relationship("Section", back_populates="course", cascade="all, delete-orphan", order_by="(Section.order_key, Section.id)")
     enrollments = relationship("Enrollment", back_populates="course")
     
 class Section(Base):
@@ -53,12 +54,16 @@ class Section(Base):
     title = Column(String)
     course_id = Column(Integer, ForeignKey("courses.id"))
     order_index = Column(Integer)
+    order_key = Column(String(collation="C"))  # Fractional ordering key, see utils/ordering.py
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     course = relationship("Course", back_populates="sections")
-    lessons = relationship("Lesson", back_populates="section", cascade="all, delete-orphan")
+    lessons = relationship("Lesson", back_populates="section", cascade="all, delete-orphan", order_by="(Lesson.order_key, Lesson.id)")
+
+    # Serves the (order_key, id) ordered reads without a sort
+    __table_args__ = (Index("ix_sections_course_id_order_key", "course_id", "order_key", "id"),)
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -71,19 +76,25 @@ class Lesson(Base):
     duration = Column(Integer, nullable=True)  # in minutes
     is_free = Column(Boolean, default=False)
     order_index = Column(Integer)
+    order_key = Column(String(collation="C"))  # Fractional ordering key, see utils/ordering.py
+    bit_index = Column(Integer)  # Stable position of this lesson in Enrollment.completed_lessons
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     section = relationship("Section", back_populates="lessons")
 
+    # Serves the (order_key, id) ordered reads without a sort
+    __table_args__ = (Index("ix_lessons_section_id_order_key", "section_id", "order_key", "id"),)
+
 class Enrollment(Base):
     __tablename__ = "enrollments"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     course_id = Column(Integer, ForeignKey("courses.id"))
-    progress = Column(Float, default=0.0)  # Percentage of course completed
+    completed_lessons = Column(LargeBinary, default=b"")  # Bitset indexed by Lesson.bit_index
+    completed_lesson_count = Column(Integer, default=0)  # Number of bits set in completed_lessons
     status = Column(String, default="active")  # active, completed, dropped
     enrolled_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
@@ -93,3 +104,22 @@ class Enrollment(Base):
     user = relationship("User", back_populates="enrollments")
     course = relationship("Course", back_populates="enrollments")
 
+    @property
+    def progress(self) -> float:
+        # Percentage of course completed, against the course's current lesson count
+        from .utils.progress import progress_percent
+        return progress_percent(self.completed_lesson_count, self.course.lesson_count if self.course else 0)
+
+class OutboxJob(Base):
+    __tablename__ = "outbox_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String)  # Registered task name
+    payload = Column(Text)  # JSON encoded {"args": [...], "kwargs": {...}}
+    status = Column(String, default="pending", index=True)  # pending, queued, failed
+    attempts = Column(Integer, default=0)
+    claimed_by = Column(String, nullable=True)  # TaskQueue.owner holding the lease while queued
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # Lease start, renewed while held
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
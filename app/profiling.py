@@ -0,0 +1,335 @@
+import asyncio
+import cProfile
+import contextvars
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from jose import JWTError, jwt
+
+from .metrics import route_template
+from .utils.security import SECRET_KEY, ALGORITHM
+
+# Two ways to see where time goes inside the app:
+#
+# * A single request sent with "X-Profile: cprofile" or "X-Profile: collapsed"
+#   and an admin bearer token gets its profile back instead of its normal body.
+# * A background sampler, started at runtime, periodically records the stacks
+#   of threadpool threads serving requests, aggregated per route template.
+#
+# Sync route handlers and dependencies run in the loop's default executor:
+# ProfilingExecutor tags each call with the request that submitted it. Async
+# code runs on the event loop thread, whose samples are attributed to the
+# request whose task the loop is running at that moment. When neither feature
+# is on, the middleware only scans the request headers and the executor adds
+# one ContextVar lookup.
+#
+# cProfile only covers threadpool work, and only one cProfile request runs at
+# a time: from Python 3.12 a profiler is global to the interpreter, so a second
+# one cannot be enabled and the active one also sees other threads.
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_MODES = ("cprofile", "collapsed")
+REQUEST_SAMPLE_INTERVAL = 0.001
+MAX_STACK_DEPTH = 128
+CPROFILE_LINES = 60
+
+EVENT_LOOP_LABEL = "<event loop>"
+
+_request_scope: contextvars.ContextVar = contextvars.ContextVar("profiling_request_scope", default=None)
+# thread id -> route label, for threads currently running request work
+_active_threads: Dict[int, str] = {}
+# event loop task -> ASGI scope, for tasks currently serving a request
+_task_scopes: Dict[asyncio.Task, dict] = {}
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_thread_id: Optional[int] = None
+_cprofile_lock = threading.Lock()
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame) -> str:
+    """Render a frame's stack root-first, in flame graph collapsed format."""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def _route_label(scope) -> str:
+    return f"{scope['method']} {route_template(scope)}"
+
+
+def _loop_task():
+    # Read from the sampler thread; a stale answer only mislabels one sample
+    if _loop is None:
+        return None
+    return asyncio.current_task(_loop)
+
+
+class _Sampler:
+    """Thread sampling the stacks of target threads at a fixed interval."""
+
+    def __init__(self, interval: float, targets: Callable[[], Dict[int, str]]):
+        self.interval = interval
+        self.targets = targets
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, label in list(self.targets().items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own_id:
+                    continue
+                stack = collapse_stack(frame)
+                self.stacks[f"{label};{stack}" if label else stack] += 1
+
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Background sampler, toggled at runtime
+
+_sampler: Optional[_Sampler] = None
+_sampler_lock = threading.Lock()
+
+
+def _background_targets() -> Dict[int, str]:
+    targets = dict(_active_threads)
+    if _loop_thread_id is not None:
+        scope = _task_scopes.get(_loop_task())
+        targets[_loop_thread_id] = _route_label(scope) if scope is not None else EVENT_LOOP_LABEL
+    return targets
+
+
+def sampler_running() -> bool:
+    return _sampler is not None
+
+
+def start_sampler(rate_hz: float):
+    global _sampler
+    with _sampler_lock:
+        previous = _sampler
+        _sampler = _Sampler(1.0 / rate_hz, _background_targets)
+        if previous is not None:
+            # Keep what was collected so far when only the rate changes
+            previous.stop()
+            _sampler.stacks = previous.stacks
+        _sampler.start()
+
+
+def stop_sampler() -> Counter:
+    global _sampler
+    with _sampler_lock:
+        sampler, _sampler = _sampler, None
+    if sampler is None:
+        return Counter()
+    sampler.stop()
+    _active_threads.clear()
+    _task_scopes.clear()
+    return sampler.stacks
+
+
+def sampler_stacks(reset: bool = False) -> Counter:
+    sampler = _sampler
+    if sampler is None:
+        return Counter()
+    stacks = Counter(sampler.stacks)
+    if reset:
+        sampler.stacks.clear()
+    return stacks
+
+
+# Per-request profiling
+
+class RequestProfile:
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.task = asyncio.current_task()
+        self.threads: Dict[int, str] = {}
+        self.profiler: Optional[cProfile.Profile] = None
+        self.profiled_calls = 0
+        # Held by the threadpool call currently running under the profiler
+        self.profiler_lock = threading.Lock()
+        self.sampler = None
+        if mode == "cprofile":
+            self.profiler = cProfile.Profile()
+        else:
+            self.sampler = _Sampler(REQUEST_SAMPLE_INTERVAL, self._targets)
+            self.sampler.start()
+
+    def _targets(self) -> Dict[int, str]:
+        targets = dict(self.threads)
+        if _loop_thread_id is not None and _loop_task() is self.task:
+            targets[_loop_thread_id] = ""
+        return targets
+
+    def finish(self) -> str:
+        if self.sampler is not None:
+            self.sampler.stop()
+            if not self.sampler.stacks:
+                return "# no samples were taken for this request\n"
+            return format_collapsed(self.sampler.stacks)
+
+        if not self.profiled_calls:
+            return "# no threadpool work was profiled for this request\n"
+        out = io.StringIO()
+        out.write("# threadpool work only; async code on the event loop is not profiled\n")
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(CPROFILE_LINES)
+        return out.getvalue()
+
+
+def _run_tagged(scope, call):
+    # Runs in a threadpool thread on behalf of the request in scope
+    thread_id = threading.get_ident()
+    profile: Optional[RequestProfile] = scope.get("profiling.request")
+    label = None
+    if sampler_running():
+        label = _route_label(scope)
+        _active_threads[thread_id] = label
+    profiler = None
+    if profile is not None:
+        profile.threads[thread_id] = ""
+        # A profiler can only be enabled once at a time; an overlapping call
+        # from the same request runs unprofiled
+        if profile.profiler is not None and profile.profiler_lock.acquire(blocking=False):
+            profiler = profile.profiler
+            profile.profiled_calls += 1
+            profiler.enable()
+    try:
+        return call()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile.profiler_lock.release()
+        if profile is not None:
+            profile.threads.pop(thread_id, None)
+        if label is not None:
+            _active_threads.pop(thread_id, None)
+
+
+class ProfilingExecutor(ThreadPoolExecutor):
+    """Default executor that lets the profilers see which request a call serves."""
+
+    def submit(self, fn, *args, **kwargs):
+        scope = _request_scope.get()
+        if scope is None:
+            return super().submit(fn, *args, **kwargs)
+        return super().submit(_run_tagged, scope, functools.partial(fn, *args, **kwargs))
+
+
+def install(loop):
+    global _loop, _loop_thread_id
+    _loop = loop
+    _loop_thread_id = threading.get_ident()
+    loop.set_default_executor(ProfilingExecutor())
+
+
+def _is_admin(headers) -> bool:
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return payload.get("role") == "admin"
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        mode = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                mode = value.decode("latin-1").strip().lower()
+                break
+
+        if mode is None:
+            if not sampler_running():
+                await self.app(scope, receive, send)
+                return
+            await self._run_tagged(scope, receive, send)
+            return
+
+        if mode not in PROFILE_MODES or not _is_admin(dict(scope["headers"])):
+            await _send_text(send, 403, "Profiling requires an admin token and X-Profile: cprofile or collapsed\n")
+            return
+
+        if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+            await _send_text(send, 409, "Another cProfile request is in progress\n")
+            return
+        try:
+            await self._run_profiled(scope, receive, send, mode)
+        finally:
+            if mode == "cprofile":
+                _cprofile_lock.release()
+
+    async def _run_tagged(self, scope, receive, send):
+        task = asyncio.current_task()
+        token = _request_scope.set(scope)
+        _task_scopes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _task_scopes.pop(task, None)
+            _request_scope.reset(token)
+
+    async def _run_profiled(self, scope, receive, send, mode: str):
+        profile = RequestProfile(mode)
+        scope["profiling.request"] = profile
+        status_code = 500
+
+        async def capture(message):
+            # The profile replaces the normal response body
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        try:
+            await self._run_tagged(scope, receive, capture)
+        finally:
+            output = profile.finish()
+        await _send_text(send, 200, output, [(b"x-profile-status", str(status_code).encode())])
+
+
+async def _send_text(send, status_code: int, text: str, headers=()):
+    body = text.encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,222 @@
+import asyncio
+import io
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import case, cast, func, select
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION
+
+from . import metrics, models
+from .database import SessionLocal
+from .tasks import TaskQueueFull, enqueue, task
+
+logger = logging.getLogger(__name__)
+
+# "Students who took this course also took": item-item cosine similarity over
+# a sparse user x course matrix, where each enrollment is weighted by how far
+# the student got. The top TOP_K neighbours of every course are precomputed
+# into an in-memory table and swapped in atomically after each build.
+#
+# Each build is a full rebuild over published courses. Enrollments are read
+# with a binary COPY parsed straight into numpy, so no per-row Python objects
+# are created. benchmarks/recommendations.py measures load plus build.
+
+TOP_K = 20
+COMPLETED_WEIGHT = 1.0
+# Active enrollments weigh between these two, linearly in progress
+MIN_PROGRESS_WEIGHT = 0.25
+MAX_PROGRESS_WEIGHT = 0.75
+# Rebuild once this many enrollments were created or dropped since the last build
+REFRESH_AFTER_CHANGES = 1000
+# Full rebuild at this interval regardless, to pick up progress updates
+REFRESH_INTERVAL_SECONDS = 3600
+# Binary COPY of (user_id int4, course_id int4, weight float8): every tuple
+# is a field count and three length-prefixed big-endian values
+COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+COPY_ROW = np.dtype([
+    ("fields", ">i2"),
+    ("user_id_len", ">i4"), ("user_id", ">i4"),
+    ("course_id_len", ">i4"), ("course_id", ">i4"),
+    ("weight_len", ">i4"), ("weight", ">f8"),
+])
+
+BUILD_SECONDS = metrics.Gauge("recommendations_build_seconds", "Duration of the last recommendation build.")
+TABLE_COURSES = metrics.Gauge("recommendations_courses", "Courses in the recommendation table.")
+TABLE_ENROLLMENTS = metrics.Gauge("recommendations_enrollments", "Enrollments used by the last build.")
+
+
+class RecommendationTable:
+    """Top-k neighbours per course, stored CSR style.
+
+    Neighbours of courses[i] are neighbors[indptr[i]:indptr[i + 1]], sorted by
+    descending score.
+    """
+
+    def __init__(self, courses: np.ndarray, indptr: np.ndarray, neighbors: np.ndarray, scores: np.ndarray):
+        self.courses = courses
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def lookup(self, course_id: int, limit: int) -> List[Tuple[int, float]]:
+        i = np.searchsorted(self.courses, course_id)
+        if i == len(self.courses) or self.courses[i] != course_id:
+            return []
+        start = self.indptr[i]
+        end = min(self.indptr[i + 1], start + limit)
+        return list(zip(self.neighbors[start:end].tolist(), self.scores[start:end].tolist()))
+
+
+def build_table(user_ids: np.ndarray, course_ids: np.ndarray, weights: np.ndarray, k: int = TOP_K) -> RecommendationTable:
+    courses, course_idx = np.unique(course_ids, return_inverse=True)
+    users, user_idx = np.unique(user_ids, return_inverse=True)
+    X = sparse.csr_matrix(
+        (weights.astype(np.float32), (user_idx, course_idx)),
+        shape=(len(users), len(courses)),
+    )
+
+    # Weighted co-enrollment between every pair of courses, then cosine
+    co = (X.T @ X).tocoo()
+    norms = np.sqrt(np.asarray(X.multiply(X).sum(axis=0)).ravel())
+    off_diagonal = co.row != co.col
+    rows, cols = co.row[off_diagonal], co.col[off_diagonal]
+    scores = co.data[off_diagonal] / (norms[rows] * norms[cols])
+
+    # Top k per row without a Python loop: sort by (row, -score) and keep each
+    # entry whose rank within its row is below k
+    order = np.lexsort((-scores, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    row_counts = np.bincount(rows, minlength=len(courses))
+    row_starts = np.concatenate(([0], np.cumsum(row_counts)[:-1]))
+    keep = np.arange(len(rows)) - row_starts[rows] < k
+    rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=len(courses)))))
+    return RecommendationTable(courses, indptr, courses[cols], scores.astype(np.float32))
+
+
+def parse_copy(data) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Parse the binary COPY output of enrollments_query() into arrays."""
+    if bytes(data[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+        raise ValueError("Not a binary COPY stream")
+    extension_len = int.from_bytes(data[15:19], "big")
+    offset = 19 + extension_len
+    # A 2-byte -1 field count ends the stream
+    count, remainder = divmod(len(data) - offset - 2, COPY_ROW.itemsize)
+    if remainder:
+        raise ValueError("Unexpected binary COPY row layout")
+    rows = np.frombuffer(data, COPY_ROW, count=count, offset=offset)
+    if count and not (
+        (rows["fields"] == 3).all()
+        and (rows["user_id_len"] == 4).all()
+        and (rows["course_id_len"] == 4).all()
+        and (rows["weight_len"] == 8).all()
+    ):
+        raise ValueError("Unexpected binary COPY row layout")
+    return rows["user_id"].astype(np.int64), rows["course_id"].astype(np.int64), rows["weight"].astype(np.float64)
+
+
+def enrollments_query():
+    # Same fraction as Enrollment.progress, computed in the query
+    progress = func.least(
+        func.coalesce(
+            func.coalesce(models.Enrollment.completed_lesson_count, 0) * 1.0
+            / func.nullif(models.Course.lesson_count, 0),
+            0,
+        ),
+        1.0,
+    )
+    weight = case(
+        (models.Enrollment.status == "completed", COMPLETED_WEIGHT),
+        else_=MIN_PROGRESS_WEIGHT + (MAX_PROGRESS_WEIGHT - MIN_PROGRESS_WEIGHT) * progress,
+    )
+    return select(models.Enrollment.user_id, models.Enrollment.course_id, cast(weight, DOUBLE_PRECISION))\
+        .join(models.Course, models.Course.id == models.Enrollment.course_id)\
+        .where(
+            models.Enrollment.status != "dropped",
+            models.Enrollment.user_id.isnot(None),
+            models.Course.status == "published",
+        )
+
+
+def load_enrollments(db) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    query = enrollments_query().compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    buffer = io.BytesIO()
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", buffer)
+    finally:
+        cursor.close()
+    return parse_copy(buffer.getbuffer())
+
+
+class RecommendationEngine:
+    def __init__(self):
+        self.table: Optional[RecommendationTable] = None
+        self.pending_changes = 0
+        self._refresh_queued = False
+        self._changes_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def recommend(self, course_id: int, limit: int = TOP_K) -> List[Tuple[int, float]]:
+        table = self.table
+        if table is None:
+            return []
+        return table.lookup(course_id, limit)
+
+    def note_change(self):
+        """Called after an enrollment is created or dropped."""
+        with self._changes_lock:
+            self.pending_changes += 1
+            due = self.pending_changes >= REFRESH_AFTER_CHANGES
+        if due:
+            self.request_refresh()
+
+    def request_refresh(self):
+        if self._refresh_queued:
+            return
+        self._refresh_queued = True
+        try:
+            enqueue(refresh_recommendations)
+        except (TaskQueueFull, RuntimeError):
+            # The next change or the periodic refresh tries again
+            self._refresh_queued = False
+
+    def refresh(self):
+        with self._build_lock:
+            self._refresh_queued = False
+            with self._changes_lock:
+                changes = self.pending_changes
+            start = time.perf_counter()
+            db = SessionLocal()
+            try:
+                user_ids, course_ids, weights = load_enrollments(db)
+            finally:
+                db.close()
+            table = build_table(user_ids, course_ids, weights)
+            self.table = table
+            with self._changes_lock:
+                self.pending_changes -= changes
+
+            BUILD_SECONDS.set(time.perf_counter() - start)
+            TABLE_COURSES.set(len(table.courses))
+            TABLE_ENROLLMENTS.set(len(weights))
+            logger.info("Built recommendations for %d courses from %d enrollments", len(table.courses), len(weights))
+
+
+engine = RecommendationEngine()
+
+
+@task
+def refresh_recommendations():
+    engine.refresh()
+
+
+async def refresh_periodically():
+    while True:
+        engine.request_refresh()
+        await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
@@ -46,5 +46,4 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     access_token = create_access_token(
         data={"sub": user.email, "role": user.role}
     )
-    print(access_token)
     return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
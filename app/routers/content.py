@@ -4,6 +4,8 @@ from typing import List
 from .. import schemas, models, database
 from ..deps import get_current_user
 from ..schemas import section as schemas
+from ..utils.progress import allocate_bit_index, reopen_completed_enrollments
+from ..utils import ordering
 
 router = APIRouter(tags=["Course Content"])
 
@@ -22,9 +24,12 @@ def create_section(
     if course.instructor_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to modify this course")
 
-    db_section = models.Section(**section.dict(), course_id=course_id)
+    ordering.lock_parent(db, models.Course, course_id)
+    order_key = ordering.key_at(db, models.Section, models.Section.course_id == course_id, section.order_index)
+    db_section = models.Section(**section.dict(), course_id=course_id, order_key=order_key)
     db.add(db_section)
     db.commit()
+    ordering.schedule_rebalance(ordering.rebalance_sections, course_id, order_key)
     db.refresh(db_section)
     return db_section
 
@@ -35,7 +40,7 @@ def get_course_sections(
 ):
     sections = db.query(models.Section)\
         .filter(models.Section.course_id == course_id)\
-        .order_by(models.Section.order_index)\
+        .order_by(models.Section.order_key, models.Section.id)\
         .all()
     return sections
 
@@ -55,13 +60,46 @@ def update_section(
     if course.instructor_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to modify this section")
 
-    for key, value in section_update.dict(exclude_unset=True).items():
+    update_data = section_update.dict(exclude_unset=True)
+    for key, value in update_data.items():
         setattr(db_section, key, value)
+
+    # order_index is a 0-based position among the course's sections
+    order_key = None
+    if update_data.get("order_index") is not None:
+        ordering.lock_parent(db, models.Course, db_section.course_id)
+        order_key = ordering.key_at(
+            db, models.Section, models.Section.course_id == db_section.course_id,
+            update_data["order_index"], exclude_id=db_section.id
+        )
+        db_section.order_key = order_key
     
     db.commit()
+    if order_key:
+        ordering.schedule_rebalance(ordering.rebalance_sections, db_section.course_id, order_key)
     db.refresh(db_section)
     return db_section
 
+@router.post("/courses/{course_id}/sections/reorder", status_code=status.HTTP_204_NO_CONTENT)
+def reorder_sections(
+    course_id: int,
+    reorder: schemas.ReorderRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    course = db.query(models.Course).filter(models.Course.id == course_id).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if course.instructor_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to modify this course")
+
+    ordering.lock_parent(db, models.Course, course_id)
+    moved_key = _reorder(db, models.Section, models.Section.course_id == course_id, reorder, "Section")
+    db.commit()
+    if moved_key:
+        ordering.schedule_rebalance(ordering.rebalance_sections, course_id, moved_key)
+    return
+
 # Lesson routes
 @router.post("/sections/{section_id}/lessons/", response_model=schemas.Lesson)
 def create_lesson(
@@ -79,9 +117,21 @@ def create_lesson(
     if course.instructor_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to modify this section")
 
-    db_lesson = models.Lesson(**lesson.dict(), section_id=section_id)
+    # Locks are always taken course first, then section: allocate_bit_index
+    # updates the course row, which section creates and rebalances lock too
+    bit_index = allocate_bit_index(db, section.course_id)
+    ordering.lock_parent(db, models.Section, section_id)
+    order_key = ordering.key_at(db, models.Lesson, models.Lesson.section_id == section_id, lesson.order_index)
+    db_lesson = models.Lesson(
+        **lesson.dict(),
+        section_id=section_id,
+        order_key=order_key,
+        bit_index=bit_index
+    )
     db.add(db_lesson)
+    reopen_completed_enrollments(db, section.course_id)
     db.commit()
+    ordering.schedule_rebalance(ordering.rebalance_lessons, section_id, order_key)
     db.refresh(db_lesson)
     return db_lesson
 
@@ -92,7 +142,7 @@ def get_section_lessons(
 ):
     lessons = db.query(models.Lesson)\
         .filter(models.Lesson.section_id == section_id)\
-        .order_by(models.Lesson.order_index)\
+        .order_by(models.Lesson.order_key, models.Lesson.id)\
         .all()
     return lessons
 
@@ -131,9 +181,69 @@ def update_lesson(
     if course.instructor_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to modify this lesson")
 
-    for key, value in lesson_update.dict(exclude_unset=True).items():
+    update_data = lesson_update.dict(exclude_unset=True)
+    for key, value in update_data.items():
         setattr(db_lesson, key, value)
+
+    # order_index is a 0-based position among the section's lessons
+    order_key = None
+    if update_data.get("order_index") is not None:
+        ordering.lock_parent(db, models.Section, db_lesson.section_id)
+        order_key = ordering.key_at(
+            db, models.Lesson, models.Lesson.section_id == db_lesson.section_id,
+            update_data["order_index"], exclude_id=db_lesson.id
+        )
+        db_lesson.order_key = order_key
     
     db.commit()
+    if order_key:
+        ordering.schedule_rebalance(ordering.rebalance_lessons, db_lesson.section_id, order_key)
     db.refresh(db_lesson)
-    return db_lesson
\ No newline at end of file
+    return db_lesson
+
+@router.post("/sections/{section_id}/lessons/reorder", status_code=status.HTTP_204_NO_CONTENT)
+def reorder_lessons(
+    section_id: int,
+    reorder: schemas.ReorderRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Permission check in one query instead of section then course
+    course = db.query(models.Course)\
+        .join(models.Section)\
+        .filter(models.Section.id == section_id)\
+        .first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Section not found")
+    if course.instructor_id != current_user.id and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized to modify this section")
+
+    ordering.lock_parent(db, models.Section, section_id)
+    moved_key = _reorder(db, models.Lesson, models.Lesson.section_id == section_id, reorder, "Lesson")
+    db.commit()
+    if moved_key:
+        ordering.schedule_rebalance(ordering.rebalance_lessons, section_id, moved_key)
+    return
+
+def _reorder(db, model, parent_filter, reorder, name):
+    # Returns the moved item's new key for a single move, None for a full ordering
+    if (reorder.id is None) == (reorder.order is None):
+        raise HTTPException(status_code=400, detail="Provide either id or order")
+
+    if reorder.order is not None:
+        try:
+            ordering.apply_order(db, model, parent_filter, reorder.order)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return None
+
+    item = db.query(model).filter(parent_filter, model.id == reorder.id).first()
+    if not item:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    if reorder.after_id == reorder.id:
+        raise HTTPException(status_code=400, detail=f"Cannot move a {name.lower()} after itself")
+    try:
+        ordering.move(db, model, parent_filter, item, reorder.after_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail=f"{name} {reorder.after_id} not found")
+    return item.order_key
\ No newline at end of file
@@ -5,6 +5,7 @@ from .. import schemas, models, database
 from ..deps import get_current_user
 from ..schemas import course as schemas
 from ..models import Course, User
+from ..recommendations import engine as recommendations, TOP_K
 
 
 router = APIRouter(prefix="/courses", tags=["Courses"])
@@ -65,4 +66,28 @@ def update_course(
     
     db.commit()
     db.refresh(db_course)
-    return db_course
\ No newline at end of file
+    return db_course
+
+@router.get("/{course_id}/recommendations", response_model=List[schemas.CourseRecommendation])
+def get_course_recommendations(
+    course_id: int,
+    limit: int = 10,
+    db: Session = Depends(database.get_db)
+):
+    # Served from the precomputed in-memory table; the primary-key lookup only
+    # drops courses unpublished since the last build
+    limit = max(0, min(limit, TOP_K))
+    candidates = recommendations.recommend(course_id, TOP_K)
+    if not candidates or limit == 0:
+        return []
+    published = {
+        row.id for row in db.query(Course.id).filter(
+            Course.id.in_([other_id for other_id, _ in candidates]),
+            Course.status == "published"
+        )
+    }
+    return [
+        {"course_id": other_id, "score": score}
+        for other_id, score in candidates
+        if other_id in published
+    ][:limit]
\ No newline at end of file
@@ -6,6 +6,9 @@ from ..deps import get_current_user
 from datetime import datetime
 from typing import Optional
 from ..schemas import enrollment as schemas
+from ..schemas.section import Lesson
+from ..utils.progress import mark_lesson_complete_stmt, first_incomplete
+from ..recommendations import engine as recommendations
 
 router = APIRouter(prefix="/enrollments", tags=["Enrollments"])
 
@@ -39,6 +42,7 @@ def create_enrollment(
     )
     db.add(db_enrollment)
     db.commit()
+    recommendations.note_change()
     db.refresh(db_enrollment)
     return db_enrollment
 
@@ -90,17 +94,20 @@ def update_enrollment(
     if enrollment.user_id != current_user.id and course.instructor_id != current_user.id and current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Not authorized to update this enrollment")
 
+    # Completion is set by complete_lesson once every lesson is done
+    if enrollment_update.status is not None and enrollment_update.status not in ("active", "dropped"):
+        raise HTTPException(status_code=400, detail="Status can only be set to active or dropped")
+
     # Update enrollment
+    previous_status = enrollment.status
     for key, value in enrollment_update.dict(exclude_unset=True).items():
         setattr(enrollment, key, value)
-    
-    # If status is changed to completed, set completed_at
-    if enrollment_update.status == "completed":
-        enrollment.completed_at = datetime.utcnow()
 
     enrollment.last_accessed_at = datetime.utcnow()
     
     db.commit()
+    if enrollment.status != previous_status:
+        recommendations.note_change()
     db.refresh(enrollment)
     return enrollment
 
@@ -121,18 +128,17 @@ def drop_enrollment(
     # Set status to dropped instead of deleting
     enrollment.status = "dropped"
     db.commit()
+    recommendations.note_change()
     return
 
 @router.post("/{enrollment_id}/update-progress", response_model=schemas.Enrollment)
 def update_progress(
     enrollment_id: int,
-    progress: float,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_user)
 ):
-    if progress < 0 or progress > 100:
-        raise HTTPException(status_code=400, detail="Progress must be between 0 and 100")
-
+    # Progress is derived from completed lessons on every read; this only
+    # records the visit. Client-supplied progress is no longer accepted.
     enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
@@ -140,14 +146,70 @@ def update_progress(
     if enrollment.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this enrollment")
 
-    enrollment.progress = progress
     enrollment.last_accessed_at = datetime.utcnow()
-    
-    # Auto-complete if progress is 100%
-    if progress == 100:
-        enrollment.status = "completed"
-        enrollment.completed_at = datetime.utcnow()
 
     db.commit()
     db.refresh(enrollment)
-    return enrollment
\ No newline at end of file
+    return enrollment
+
+@router.post("/{enrollment_id}/lessons/{lesson_id}/complete", response_model=schemas.Enrollment)
+def complete_lesson(
+    enrollment_id: int,
+    lesson_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
+    if not enrollment:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+
+    if enrollment.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to update this enrollment")
+
+    if enrollment.status == "dropped":
+        raise HTTPException(status_code=400, detail="Enrollment has been dropped")
+
+    # Lesson must belong to the enrolled course
+    lesson = db.query(models.Lesson)\
+        .join(models.Section)\
+        .filter(models.Lesson.id == lesson_id, models.Section.course_id == enrollment.course_id)\
+        .first()
+    if not lesson:
+        raise HTTPException(status_code=404, detail="Lesson not found in this course")
+
+    course = db.query(models.Course).filter(models.Course.id == enrollment.course_id).first()
+
+    # Single UPDATE: OR the lesson's bit in, bump the counter, recompute
+    # auto-complete once every lesson is done
+    db.execute(mark_lesson_complete_stmt(enrollment.id, lesson.bit_index, course.lesson_count))
+    db.commit()
+    db.refresh(enrollment)
+    return enrollment
+
+@router.get("/{enrollment_id}/next-lesson", response_model=Lesson)
+def get_next_lesson(
+    enrollment_id: int,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
+    if not enrollment:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+
+    if enrollment.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to view this enrollment")
+
+    # Only (id, bit_index) pairs are loaded; the full row is fetched for the match
+    lessons = db.query(models.Lesson.id, models.Lesson.bit_index)\
+        .join(models.Section)\
+        .filter(models.Section.course_id == enrollment.course_id)\
+        .order_by(
+            models.Section.order_key, models.Section.id,
+            models.Lesson.order_key, models.Lesson.id
+        )\
+        .all()
+    lesson_id = first_incomplete(enrollment.completed_lessons, lessons)
+    if lesson_id is None:
+        raise HTTPException(status_code=404, detail="No incomplete lessons")
+
+    return db.query(models.Lesson).filter(models.Lesson.id == lesson_id).first()
\ No newline at end of file
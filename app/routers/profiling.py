@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from .. import models, profiling
+from ..deps import get_current_user
+
+router = APIRouter(prefix="/profiling", tags=["Profiling"])
+
+def require_admin(current_user: models.User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can use the profiler")
+    return current_user
+
+@router.post("/sampler", status_code=status.HTTP_204_NO_CONTENT)
+def start_sampler(
+    rate_hz: float = 100,
+    current_user: models.User = Depends(require_admin)
+):
+    if rate_hz <= 0 or rate_hz > 1000:
+        raise HTTPException(status_code=400, detail="rate_hz must be between 0 and 1000")
+    profiling.start_sampler(rate_hz)
+    return
+
+@router.get("/sampler", response_class=PlainTextResponse)
+def get_sampler_stacks(
+    reset: bool = False,
+    current_user: models.User = Depends(require_admin)
+):
+    # Collapsed stacks (one "route;frame;frame count" per line), ready for flamegraph.pl
+    return profiling.format_collapsed(profiling.sampler_stacks(reset=reset))
+
+@router.delete("/sampler", response_class=PlainTextResponse)
+def stop_sampler(
+    current_user: models.User = Depends(require_admin)
+):
+    return profiling.format_collapsed(profiling.stop_sampler())
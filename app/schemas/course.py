@@ -24,8 +24,13 @@ class CourseUpdate(BaseModel):
 class Course(CourseBase):
     id: int
     instructor_id: int
+    lesson_count: Optional[int] = 0
     created_at: datetime
     updated_at: Optional[datetime]
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+class CourseRecommendation(BaseModel):
+    course_id: int
+    score: float
\ No newline at end of file
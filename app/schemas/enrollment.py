@@ -9,13 +9,14 @@ class EnrollmentCreate(EnrollmentBase):
     pass
 
 class EnrollmentUpdate(BaseModel):
+    # progress and completion are derived from completed lessons
     status: Optional[str] = None
-    progress: Optional[float] = None
 
 class Enrollment(EnrollmentBase):
     id: int
     user_id: int
     progress: float
+    completed_lesson_count: Optional[int] = 0
     status: str
     enrolled_at: datetime
     completed_at: Optional[datetime]
@@ -9,7 +9,9 @@ class LessonBase(BaseModel):
     video_url: Optional[str] = None
     duration: Optional[int] = None
     is_free: bool = False
-    order_index: int
+    # 0-based position among the section's lessons; omitted appends. Ordering
+    # itself is kept in order_key.
+    order_index: Optional[int] = None
 
 class LessonCreate(LessonBase):
     pass
@@ -25,6 +27,7 @@ class LessonUpdate(BaseModel):
 class Lesson(LessonBase):
     id: int
     section_id: int
+    order_key: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime]
 
@@ -34,7 +37,9 @@ class Lesson(LessonBase):
 # Section schemas
 class SectionBase(BaseModel):
     title: str
-    order_index: int
+    # 0-based position among the course's sections; omitted appends. Ordering
+    # itself is kept in order_key.
+    order_index: Optional[int] = None
 
 class SectionCreate(SectionBase):
     pass
@@ -46,9 +51,18 @@ class SectionUpdate(BaseModel):
 class Section(SectionBase):
     id: int
     course_id: int
+    order_key: Optional[str] = None
     created_at: datetime
     updated_at: Optional[datetime]
     lessons: List[Lesson] = []
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# Reorder schema, shared by sections and lessons
+class ReorderRequest(BaseModel):
+    # Either move one item after another (after_id=None moves it to the front)...
+    id: Optional[int] = None
+    after_id: Optional[int] = None
+    # ...or give the complete new ordering of ids
+    order: Optional[List[int]] = None
\ No newline at end of file
@@ -0,0 +1,421 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import and_, func, or_
+
+from . import metrics, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# to be stored in environment variables
+QUEUE_MAXSIZE = 1000
+WORKER_COUNT = 4
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.5
+RETRY_BACKOFF_MAX_SECONDS = 60
+DRAIN_TIMEOUT_SECONDS = 10
+USE_OUTBOX = False
+OUTBOX_POLL_SECONDS = 5
+# A queued outbox row whose lease is older than this is assumed abandoned (its
+# process died) and may be claimed by another process. Leases are renewed
+# every OUTBOX_LEASE_RENEW_SECONDS while held.
+OUTBOX_LEASE_SECONDS = 300
+OUTBOX_LEASE_RENEW_SECONDS = 60
+# Pause after an unexpected error in a worker or the relay (doubling for
+# consecutive relay errors up to RETRY_BACKOFF_MAX_SECONDS)
+ERROR_BACKOFF_SECONDS = 1
+
+_registry = {}
+
+TASK_JOBS = metrics.Counter("task_jobs_total", "Background jobs by outcome.", ("result",))
+TASK_LATENCY = metrics.Histogram(
+    "task_job_latency_seconds", "Time from enqueue until a background job finished.", ("task",)
+)
+TASK_QUEUE_DEPTH = metrics.Gauge("task_queue_depth", "Background jobs waiting for a worker.")
+TASK_IN_FLIGHT = metrics.Gauge("task_queue_in_flight", "Background jobs currently running.")
+TASK_WAITING_RETRY = metrics.Gauge("task_queue_waiting_retry", "Background jobs waiting to be retried.")
+
+
+def task(fn: Callable) -> Callable:
+    """Register a function so it can be enqueued (and stored in the outbox) by name."""
+    _registry[fn.__name__] = fn
+    return fn
+
+
+class TaskQueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    name: str
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    attempts: int = 0
+    enqueued_at: float = field(default_factory=time.time)
+    outbox_id: Optional[int] = None
+
+
+class TaskQueue:
+    """Bounded asyncio queue drained by a fixed pool of workers.
+
+    Sync task functions run in the queue's own thread pool, so they may use
+    their own SessionLocal() like any other blocking code without taking
+    threads from the request threadpool. With use_outbox=True jobs are
+    written to the outbox_jobs table first and fed into the queue by a relay.
+    Claimed rows carry a lease owned by this process; rows whose lease expired
+    (the owner died before finishing them) are claimed again by any relay.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = QUEUE_MAXSIZE,
+        workers: int = WORKER_COUNT,
+        max_attempts: int = MAX_ATTEMPTS,
+        use_outbox: bool = USE_OUTBOX,
+    ):
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self.max_attempts = max_attempts
+        self.use_outbox = use_outbox
+        self._loop = None
+        self._executor = None
+        self._queue = None
+        self._tasks = []
+        self._retries = set()
+        self._wakeup = None
+        self._relay_task = None
+        # Outbox ids claimed by this process and not yet handled by a worker
+        self._held = set()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.in_flight = 0
+        metrics.register_collector(self._collect_metrics)
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        # One thread per worker, plus one so the relay's outbox I/O never
+        # waits behind long jobs
+        self._executor = ThreadPoolExecutor(max_workers=self.worker_count + 1, thread_name_prefix="task-queue")
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [self._loop.create_task(self._worker()) for _ in range(self.worker_count)]
+        if self.use_outbox:
+            self._wakeup = asyncio.Event()
+            self._relay_task = self._loop.create_task(self._relay())
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT_SECONDS):
+        if not self.running:
+            return
+        if self._relay_task is not None:
+            # Stop claiming new outbox rows, otherwise the drain never finishes
+            self._relay_task.cancel()
+            await asyncio.gather(self._relay_task, return_exceptions=True)
+            self._relay_task = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Task queue drain timed out with %d jobs left", self._queue.qsize())
+        for handle in self._retries:
+            handle.cancel()
+        if self._retries and not self.use_outbox:
+            logger.warning("Dropping %d jobs waiting to be retried", len(self._retries))
+        self._retries.clear()
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.use_outbox:
+            # Hand undrained rows back right away instead of waiting for the lease
+            await self._call(self._release_outbox)
+        # Jobs still running after the drain timeout finish in the background
+        self._executor.shutdown(wait=False)
+        self._executor = None
+        self._loop = None
+
+    def enqueue(self, fn, *args, **kwargs):
+        """Schedule a registered task. Safe to call from sync route handlers."""
+        name = fn if isinstance(fn, str) else fn.__name__
+        if name not in _registry:
+            raise ValueError(f"Task {name!r} is not registered")
+        if not self.running:
+            raise RuntimeError("Task queue is not running")
+
+        job = Job(name=name, args=args, kwargs=kwargs)
+        TASK_JOBS.inc(("enqueued",))
+        if self.use_outbox:
+            self._write_outbox(job)
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+            return
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if running_loop is self._loop:
+            self._put(job)
+        else:
+            asyncio.run_coroutine_threadsafe(self._put_async(job), self._loop).result()
+
+    def _collect_metrics(self):
+        TASK_QUEUE_DEPTH.set(self._queue.qsize() if self._queue else 0)
+        TASK_IN_FLIGHT.set(self.in_flight)
+        TASK_WAITING_RETRY.set(len(self._retries))
+
+    def _put(self, job: Job):
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            TASK_JOBS.inc(("rejected",))
+            raise TaskQueueFull(f"Task queue is full ({self.maxsize} jobs)")
+
+    async def _put_async(self, job: Job):
+        self._put(job)
+
+    async def _call(self, fn, *args):
+        return await self._loop.run_in_executor(self._executor, fn, *args)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self.in_flight += 1
+            try:
+                await self._run(job)
+            except Exception:
+                # Job failures are handled in _run; this is the bookkeeping
+                # around them (e.g. an outbox update). An outbox row left
+                # queued is reclaimed once its lease expires.
+                logger.exception("Task queue worker error while handling %s", job.name)
+                await asyncio.sleep(ERROR_BACKOFF_SECONDS)
+            finally:
+                self.in_flight -= 1
+                self._held.discard(job.outbox_id)
+                self._queue.task_done()
+
+    async def _run(self, job: Job):
+        fn = _registry[job.name]
+        job.attempts += 1
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                await fn(*job.args, **job.kwargs)
+            else:
+                await self._call(functools.partial(fn, *job.args, **job.kwargs))
+        except Exception as exc:
+            logger.exception("Task %s failed (attempt %d/%d)", job.name, job.attempts, self.max_attempts)
+            await self._retry_or_fail(job, exc)
+            return
+
+        TASK_LATENCY.observe(time.time() - job.enqueued_at, (job.name,))
+        TASK_JOBS.inc(("succeeded",))
+        if job.outbox_id is not None:
+            await self._call(self._delete_outbox, job.outbox_id)
+
+    async def _retry_or_fail(self, job: Job, exc: Exception):
+        if job.attempts >= self.max_attempts:
+            TASK_JOBS.inc(("failed",))
+            if job.outbox_id is not None:
+                await self._call(self._fail_outbox, job, repr(exc))
+            return
+
+        TASK_JOBS.inc(("retried",))
+        delay = min(RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1), RETRY_BACKOFF_MAX_SECONDS)
+        if job.outbox_id is not None:
+            # The relay picks the row up again once available_at has passed
+            await self._call(self._reschedule_outbox, job, delay, repr(exc))
+            return
+
+        def requeue():
+            self._retries.discard(handle)
+            try:
+                self._put(job)
+            except TaskQueueFull:
+                TASK_JOBS.inc(("failed",))
+                logger.error("Dropping retry of task %s, queue is full", job.name)
+
+        handle = self._loop.call_later(delay, requeue)
+        self._retries.add(handle)
+
+    async def _relay(self):
+        renewed_at = time.monotonic()
+        backoff = ERROR_BACKOFF_SECONDS
+        while True:
+            try:
+                if time.monotonic() - renewed_at >= OUTBOX_LEASE_RENEW_SECONDS:
+                    await self._call(self._renew_outbox_leases, list(self._held))
+                    renewed_at = time.monotonic()
+                free = self.maxsize - self._queue.qsize()
+                jobs = await self._call(self._claim_outbox, max(free, 1))
+            except Exception:
+                logger.exception("Outbox relay failed, retrying in %gs", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX_SECONDS)
+                continue
+            backoff = ERROR_BACKOFF_SECONDS
+
+            self._held.update(job.outbox_id for job in jobs)
+            for job in jobs:
+                await self._queue.put(job)
+            if not jobs:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    # Outbox storage, all blocking and called through the executor (or from
+    # the request thread in enqueue)
+
+    def _write_outbox(self, job: Job):
+        db = SessionLocal()
+        try:
+            row = models.OutboxJob(
+                name=job.name,
+                payload=json.dumps({"args": list(job.args), "kwargs": job.kwargs})
+            )
+            db.add(row)
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_outbox(self, limit: int):
+        db = SessionLocal()
+        try:
+            rows = db.query(models.OutboxJob)\
+                .filter(or_(
+                    and_(
+                        models.OutboxJob.status == "pending",
+                        models.OutboxJob.available_at <= func.now()
+                    ),
+                    and_(
+                        models.OutboxJob.status == "queued",
+                        models.OutboxJob.claimed_at < func.now() - timedelta(seconds=OUTBOX_LEASE_SECONDS)
+                    )
+                ))\
+                .order_by(models.OutboxJob.id)\
+                .limit(limit)\
+                .with_for_update(skip_locked=True)\
+                .all()
+            jobs = []
+            for row in rows:
+                # Rows that can never run (task renamed or removed, bad
+                # payload) are failed instead of stopping the relay
+                if row.name not in _registry:
+                    self._fail_claimed_row(row, f"Task {row.name!r} is not registered")
+                    continue
+                try:
+                    payload = json.loads(row.payload)
+                    args, kwargs = tuple(payload["args"]), dict(payload["kwargs"])
+                except (TypeError, ValueError, KeyError) as exc:
+                    self._fail_claimed_row(row, f"Invalid payload: {exc!r}")
+                    continue
+                row.status = "queued"
+                row.claimed_by = self.owner
+                row.claimed_at = func.now()
+                jobs.append(Job(
+                    name=row.name,
+                    args=args,
+                    kwargs=kwargs,
+                    attempts=row.attempts,
+                    enqueued_at=row.created_at.timestamp(),
+                    outbox_id=row.id
+                ))
+            db.commit()
+            return jobs
+        finally:
+            db.close()
+
+    @staticmethod
+    def _fail_claimed_row(row, error: str):
+        logger.error("Failing outbox job %d: %s", row.id, error)
+        TASK_JOBS.inc(("failed",))
+        row.status = "failed"
+        row.claimed_by = None
+        row.claimed_at = None
+        row.last_error = error
+
+    def _delete_outbox(self, outbox_id: int):
+        db = SessionLocal()
+        try:
+            db.query(models.OutboxJob)\
+                .filter(models.OutboxJob.id == outbox_id, models.OutboxJob.claimed_by == self.owner)\
+                .delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _reschedule_outbox(self, job: Job, delay: float, error: str):
+        self._update_outbox(job.outbox_id, {
+            "status": "pending",
+            "claimed_by": None,
+            "claimed_at": None,
+            "attempts": job.attempts,
+            "last_error": error,
+            # Database clock, the same one _claim_outbox compares against
+            "available_at": func.now() + timedelta(seconds=delay),
+        })
+
+    def _fail_outbox(self, job: Job, error: str):
+        self._update_outbox(job.outbox_id, {
+            "status": "failed",
+            "attempts": job.attempts,
+            "last_error": error,
+        })
+
+    def _update_outbox(self, outbox_id: int, values: dict):
+        # Only while we still hold the lease; otherwise another process owns the row
+        db = SessionLocal()
+        try:
+            db.query(models.OutboxJob)\
+                .filter(models.OutboxJob.id == outbox_id, models.OutboxJob.claimed_by == self.owner)\
+                .update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _renew_outbox_leases(self, outbox_ids):
+        # Only rows still waiting or running here; a row whose final update
+        # failed lets its lease expire and is picked up again
+        if not outbox_ids:
+            return
+        db = SessionLocal()
+        try:
+            db.query(models.OutboxJob)\
+                .filter(
+                    models.OutboxJob.id.in_(outbox_ids),
+                    models.OutboxJob.status == "queued",
+                    models.OutboxJob.claimed_by == self.owner
+                )\
+                .update({"claimed_at": func.now()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _release_outbox(self):
+        self._update_owned({"status": "pending", "claimed_by": None, "claimed_at": None})
+
+    def _update_owned(self, values: dict):
+        db = SessionLocal()
+        try:
+            db.query(models.OutboxJob)\
+                .filter(models.OutboxJob.status == "queued", models.OutboxJob.claimed_by == self.owner)\
+                .update(values, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+task_queue = TaskQueue()
+enqueue = task_queue.enqueue
@@ -0,0 +1,250 @@
+import string
+from typing import Dict, List, Optional, Sequence
+
+from .. import models
+from ..database import SessionLocal
+from ..tasks import TaskQueueFull, enqueue, task
+
+# Sections and lessons are ordered by order_key, a base-62 string compared
+# lexicographically. A new key can always be generated between two existing
+# ones, so moving an item only rewrites that item's key. Keys never end in
+# "0", which guarantees there is room below every key.
+
+DIGITS = string.digits + string.ascii_uppercase + string.ascii_lowercase
+# Repeated moves into the same gap add a character every few moves; once a
+# key gets this long the siblings are respaced in the background
+MAX_KEY_LENGTH = 16
+
+
+def key_between(a: Optional[str], b: Optional[str]) -> str:
+    """Return a key strictly between a and b (None means the open end)."""
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"{a!r} is not less than {b!r}")
+    # At either end step by one digit instead of halving the gap, so repeated
+    # appends or moves to the front only add a character every ~60 moves
+    if a is None and b is not None:
+        return _step_down(b)
+    if b is None and a is not None:
+        return _step_up(a)
+    return _midpoint(a or "", b)
+
+
+def _step_down(b: str) -> str:
+    for i, digit in enumerate(b):
+        index = DIGITS.index(digit)
+        if index > 1:
+            return b[:i] + DIGITS[index - 1]
+    # Only "0"s and "1"s: go just below the first "1", leaving the most room
+    i = b.index(DIGITS[1])
+    return b[:i] + DIGITS[0] + DIGITS[-1]
+
+
+def _step_up(a: str) -> str:
+    for i, digit in enumerate(a):
+        index = DIGITS.index(digit)
+        if index < len(DIGITS) - 1:
+            return a[:i] + DIGITS[index + 1]
+    # All "z": extend with the lowest non-zero digit, leaving the most room
+    return a + DIGITS[1]
+
+
+def _midpoint(a: str, b: Optional[str]) -> str:
+    if b is not None:
+        # Keep the shared prefix (a is padded with zeros) and recurse on the rest
+        n = 0
+        while n < len(b) and (a[n] if n < len(a) else "0") == b[n]:
+            n += 1
+        if n:
+            return b[:n] + _midpoint(a[n:], b[n:])
+
+    low = DIGITS.index(a[0]) if a else 0
+    high = DIGITS.index(b[0]) if b is not None else len(DIGITS)
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    # Consecutive digits: a longer b leaves room at its first digit, otherwise
+    # extend a
+    if b is not None and len(b) > 1:
+        return b[0]
+    return DIGITS[low] + _midpoint(a[1:], None)
+
+
+def keys_between(a: Optional[str], b: Optional[str], n: int) -> List[str]:
+    """Return n increasing keys between a and b, split evenly to keep them short."""
+    if n == 0:
+        return []
+    mid = key_between(a, b)
+    left = (n - 1) // 2
+    return keys_between(a, mid, left) + [mid] + keys_between(mid, b, n - 1 - left)
+
+
+def spread_keys(n: int) -> List[str]:
+    """Return n equal-width keys spaced evenly over the whole key space."""
+    width = 1
+    while len(DIGITS) ** width <= n:
+        width += 1
+    space = len(DIGITS) ** width
+    keys = []
+    for i in range(1, n + 1):
+        value = i * space // (n + 1)
+        digits = []
+        for _ in range(width):
+            value, d = divmod(value, len(DIGITS))
+            digits.append(DIGITS[d])
+        keys.append("".join(reversed(digits)).rstrip("0"))
+    return keys
+
+
+def _increasing_subsequence(keys: Sequence[Optional[str]]) -> set:
+    # Positions of a longest strictly increasing run of keys; those items can
+    # keep their key when applying a full ordering
+    tails, tail_pos, prev = [], [], [None] * len(keys)
+    for i, key in enumerate(keys):
+        if key is None:
+            continue
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == len(tails):
+            tails.append(key)
+            tail_pos.append(i)
+        else:
+            tails[lo] = key
+            tail_pos[lo] = i
+        prev[i] = tail_pos[lo - 1] if lo else None
+    keep = set()
+    i = tail_pos[-1] if tail_pos else None
+    while i is not None:
+        keep.add(i)
+        i = prev[i]
+    return keep
+
+
+def plan_order(keys: Sequence[Optional[str]]) -> Dict[int, str]:
+    """Given current keys in the desired order, return {position: new key} for
+    the fewest items that need a new key."""
+    keep = _increasing_subsequence(keys)
+    changes = {}
+    lower = None
+    run = []
+    for i, key in enumerate(list(keys) + [None]):
+        if i < len(keys) and i not in keep:
+            run.append(i)
+            continue
+        upper = key if i < len(keys) else None
+        for pos, new_key in zip(run, keys_between(lower, upper, len(run))):
+            changes[pos] = new_key
+        run = []
+        lower = upper
+    return changes
+
+
+# Database helpers, shared by sections (parent: course) and lessons (parent: section)
+
+def _siblings(db, model, parent_filter):
+    return db.query(model).filter(parent_filter)
+
+
+def lock_parent(db, parent_model, parent_id: int):
+    """Serialize key changes among one parent's children for this transaction.
+
+    Keys are computed from the neighbours' current keys, so two concurrent
+    creates or moves into the same gap would otherwise pick the same key.
+    """
+    db.query(parent_model.id)\
+        .filter(parent_model.id == parent_id)\
+        .with_for_update()\
+        .first()
+
+
+def key_at(db, model, parent_filter, position: Optional[int] = None, exclude_id: Optional[int] = None) -> str:
+    """Key placing an item at a 0-based position among its siblings.
+
+    position None, or past the end, appends. exclude_id leaves the item being
+    moved out of the sibling list. Call with the parent locked.
+    """
+    keys = db.query(model.order_key).filter(parent_filter)
+    if exclude_id is not None:
+        keys = keys.filter(model.id != exclude_id)
+
+    lower = None
+    if position is None or position > 0:
+        if position is None:
+            lower = keys.order_by(model.order_key.desc()).first()
+        else:
+            lower = keys.order_by(model.order_key).offset(position - 1).first()
+            if lower is None:
+                lower = keys.order_by(model.order_key.desc()).first()
+        lower = lower[0] if lower else None
+    if lower is not None:
+        keys = keys.filter(model.order_key > lower)
+    upper = keys.order_by(model.order_key).first() if position is not None else None
+    return key_between(lower, upper[0] if upper else None)
+
+
+def rebalance(db, model, parent_filter):
+    """Respace all sibling keys evenly, keeping the current order."""
+    items = _siblings(db, model, parent_filter)\
+        .order_by(model.order_key, model.id)\
+        .all()
+    for item, key in zip(items, spread_keys(len(items))):
+        item.order_key = key
+
+
+def move(db, model, parent_filter, item, after_id: Optional[int]):
+    """Place item directly after sibling after_id, or first if after_id is None."""
+    others = db.query(model.order_key).filter(parent_filter, model.id != item.id)
+    if after_id is None:
+        lower = None
+    else:
+        after = db.query(model.order_key).filter(parent_filter, model.id == after_id).first()
+        if after is None:
+            raise LookupError(after_id)
+        lower = after[0]
+        others = others.filter(model.order_key > lower)
+    upper = others.order_by(model.order_key).first()
+    item.order_key = key_between(lower, upper[0] if upper else None)
+
+
+def apply_order(db, model, parent_filter, ids: List[int]):
+    """Reorder siblings to match ids, which must list every sibling exactly once."""
+    items = {item.id: item for item in _siblings(db, model, parent_filter).all()}
+    if len(ids) != len(items) or set(ids) != set(items):
+        raise ValueError("Ordering must contain every item exactly once")
+    ordered = [items[i] for i in ids]
+    for pos, key in plan_order([item.order_key for item in ordered]).items():
+        ordered[pos].order_key = key
+
+
+def schedule_rebalance(rebalance_task, parent_id: int, key: str):
+    if len(key) > MAX_KEY_LENGTH:
+        try:
+            enqueue(rebalance_task, parent_id)
+        except (TaskQueueFull, RuntimeError):
+            # Long keys still sort correctly; the next long key retries this
+            pass
+
+
+@task
+def rebalance_sections(course_id: int):
+    db = SessionLocal()
+    try:
+        lock_parent(db, models.Course, course_id)
+        rebalance(db, models.Section, models.Section.course_id == course_id)
+        db.commit()
+    finally:
+        db.close()
+
+
+@task
+def rebalance_lessons(section_id: int):
+    db = SessionLocal()
+    try:
+        lock_parent(db, models.Section, section_id)
+        rebalance(db, models.Lesson, models.Lesson.section_id == section_id)
+        db.commit()
+    finally:
+        db.close()
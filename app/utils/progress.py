@@ -0,0 +1,88 @@
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+from sqlalchemy import LargeBinary, case, func, literal, update
+
+from .. import models
+
+# Lesson completion is stored per enrollment as a bitset (bytea) where bit N
+# belongs to the lesson with Lesson.bit_index == N. Bits are numbered the same
+# way as PostgreSQL's get_bit/set_bit on bytea: byte N // 8, bit N % 8 from the
+# least significant end, which matches int.from_bytes(..., "little").
+
+
+def allocate_bit_index(db, course_id: int) -> int:
+    # Bump the cached lesson count and hand out the previous value as the new
+    # lesson's bit index, in one statement so concurrent creates never collide.
+    new_count = db.execute(
+        update(models.Course)
+        .where(models.Course.id == course_id)
+        .values(lesson_count=func.coalesce(models.Course.lesson_count, 0) + 1)
+        .returning(models.Course.lesson_count)
+    ).scalar_one()
+    return new_count - 1
+
+
+def reopen_completed_enrollments(db, course_id: int):
+    # A new lesson means nobody has finished the course anymore
+    db.execute(
+        update(models.Enrollment)
+        .where(models.Enrollment.course_id == course_id, models.Enrollment.status == "completed")
+        .values(status="active", completed_at=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def mark_lesson_complete_stmt(enrollment_id: int, bit_index: int, lesson_count: int):
+    byte_index = bit_index // 8
+    bits = func.coalesce(models.Enrollment.completed_lessons, literal(b"", LargeBinary))
+
+    # Grow the bitset with zero bytes if the lesson's bit is past its end,
+    # then OR the bit in.
+    padding = func.decode(
+        func.repeat("00", func.greatest(0, byte_index + 1 - func.length(bits))),
+        "hex",
+        type_=LargeBinary,
+    )
+    new_bits = func.set_bit(bits.op("||")(padding), bit_index, 1, type_=LargeBinary)
+
+    # Only count the lesson once, even if it is marked complete again.
+    already_set = case(
+        (func.length(bits) <= byte_index, 0),
+        else_=func.get_bit(bits, bit_index),
+    )
+    new_count = func.coalesce(models.Enrollment.completed_lesson_count, 0) + 1 - already_set
+    is_done = new_count >= lesson_count
+    now = datetime.utcnow()
+
+    # Dropped enrollments are never flipped back to completed
+    return (
+        update(models.Enrollment)
+        .where(models.Enrollment.id == enrollment_id, models.Enrollment.status != "dropped")
+        .values(
+            completed_lessons=new_bits,
+            completed_lesson_count=new_count,
+            status=case((is_done, "completed"), else_=models.Enrollment.status),
+            completed_at=case(
+                (is_done, func.coalesce(models.Enrollment.completed_at, now)),
+                else_=models.Enrollment.completed_at,
+            ),
+            last_accessed_at=now,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+def progress_percent(completed_lesson_count: Optional[int], lesson_count: Optional[int]) -> float:
+    if not lesson_count:
+        return 0.0
+    return min((completed_lesson_count or 0) * 100.0 / lesson_count, 100.0)
+
+
+def first_incomplete(completed_lessons: Optional[bytes], lessons: Iterable[Tuple[int, int]]) -> Optional[int]:
+    # lessons is (lesson_id, bit_index) in course order
+    bits = int.from_bytes(completed_lessons or b"", "little")
+    for lesson_id, bit_index in lessons:
+        if not bits >> bit_index & 1:
+            return lesson_id
+    return None
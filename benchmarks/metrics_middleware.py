@@ -0,0 +1,75 @@
+"""Per-request overhead of MetricsMiddleware.
+
+Drives a small FastAPI app directly through ASGI (no server, no sockets) with
+and without the middleware and reports the difference per request. Run from
+the repository root:
+
+    python -m benchmarks.metrics_middleware [requests]
+"""
+import asyncio
+import sys
+import time
+
+from fastapi import FastAPI
+
+from app.metrics import MetricsMiddleware
+
+
+def build_app():
+    app = FastAPI()
+
+    @app.get("/courses/{course_id}")
+    async def get_course(course_id: int):
+        return {"id": course_id, "title": "Course"}
+
+    return app
+
+
+async def _receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def _send(message):
+    pass
+
+
+async def run(asgi_app, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/courses/{i % 1000}",
+            "raw_path": f"/courses/{i % 1000}".encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("bench", 80),
+        }
+        await asgi_app(scope, _receive, _send)
+    return (time.perf_counter() - start) / n
+
+
+async def main(n: int):
+    plain = build_app()
+    instrumented = MetricsMiddleware(build_app())
+    # Warm up routing and the route template cache
+    await run(plain, 1000)
+    await run(instrumented, 1000)
+
+    # Interleave rounds so drift affects both sides equally; keep the best
+    base = with_metrics = float("inf")
+    for _ in range(5):
+        base = min(base, await run(plain, n))
+        with_metrics = min(with_metrics, await run(instrumented, n))
+    print(f"without middleware: {base * 1e6:8.2f} us/request")
+    print(f"with middleware:    {with_metrics * 1e6:8.2f} us/request")
+    print(f"overhead:           {(with_metrics - base) * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
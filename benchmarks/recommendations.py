@@ -0,0 +1,71 @@
+"""Duration of a recommendation rebuild, load included.
+
+By default enrollments are synthesized (skewed course popularity, a seeded
+generator) and encoded exactly as PostgreSQL's binary COPY sends them, so the
+load step measures the same parsing the API process does. With --database the
+enrollments are read from the configured database instead, which adds the
+query and transfer. Run from the repository root:
+
+    python -m benchmarks.recommendations [enrollments] [--database]
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.recommendations import COPY_ROW, COPY_SIGNATURE, build_table, load_enrollments, parse_copy
+
+USERS_PER_ENROLLMENT = 0.2
+COURSES = 5000
+
+
+def synthesize(n: int, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    rows = np.zeros(n, COPY_ROW)
+    rows["fields"] = 3
+    rows["user_id_len"] = rows["course_id_len"] = 4
+    rows["weight_len"] = 8
+    rows["user_id"] = rng.integers(1, max(2, int(n * USERS_PER_ENROLLMENT)), n)
+    # A few courses draw most enrollments
+    rows["course_id"] = np.minimum(rng.zipf(1.3, n), COURSES)
+    rows["weight"] = rng.uniform(0.25, 1.0, n)
+    header = COPY_SIGNATURE + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+    return header + rows.tobytes() + (-1).to_bytes(2, "big", signed=True)
+
+
+def load_from_database():
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return load_enrollments(db)
+    finally:
+        db.close()
+
+
+def main(n: int, database: bool):
+    if database:
+        load = load_from_database
+    else:
+        data = synthesize(n)
+        load = lambda: parse_copy(data)
+
+    # Best of 3 for each step
+    load_seconds = build_seconds = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        user_ids, course_ids, weights = load()
+        loaded = time.perf_counter()
+        table = build_table(user_ids, course_ids, weights)
+        built = time.perf_counter()
+        load_seconds = min(load_seconds, loaded - start)
+        build_seconds = min(build_seconds, built - loaded)
+
+    print(f"enrollments: {len(weights)}, courses: {len(table.courses)}")
+    print(f"load:        {load_seconds * 1e3:8.1f} ms")
+    print(f"build:       {build_seconds * 1e3:8.1f} ms")
+    print(f"total:       {(load_seconds + build_seconds) * 1e3:8.1f} ms")
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    main(int(args[0]) if args else 1_000_000, "--database" in sys.argv)
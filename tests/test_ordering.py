@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from app.utils.ordering import DIGITS, key_between, keys_between, plan_order, spread_keys
+
+
+def test_key_between_first_key():
+    key = key_between(None, None)
+    assert key and not key.endswith("0")
+
+
+def test_key_before_and_after():
+    assert key_between(None, "V") < "V"
+    assert key_between("V", None) > "V"
+
+
+def test_key_between_neighbours():
+    for a, b in [("1", "2"), ("a", "b"), ("a", "a1"), ("az", "b"), ("0z", "1"), ("V", "V01")]:
+        key = key_between(a, b)
+        assert a < key < b
+        assert not key.endswith("0")
+
+
+@pytest.mark.parametrize("a, b", [("a", "a"), ("b", "a")])
+def test_key_between_rejects_unordered(a, b):
+    with pytest.raises(ValueError):
+        key_between(a, b)
+
+
+def test_keys_between():
+    keys = keys_between("1", "2", 50)
+    assert keys == sorted(keys)
+    assert len(set(keys)) == 50
+    assert all("1" < key < "2" for key in keys)
+
+
+def test_spread_keys():
+    for n in (1, 10, len(DIGITS), 5000):
+        keys = spread_keys(n)
+        assert len(keys) == n
+        assert keys == sorted(keys)
+        assert len(set(keys)) == n
+        assert all(key and not key.endswith("0") for key in keys)
+
+
+def test_repeated_moves_to_the_ends_stay_short():
+    first = last = key_between(None, None)
+    for _ in range(200):
+        first = key_between(None, first)
+        last = key_between(last, None)
+    assert len(first) <= 5
+    assert len(last) <= 5
+
+
+def test_random_inserts_stay_ordered():
+    rng = random.Random(0)
+    keys = [key_between(None, None)]
+    for _ in range(5000):
+        i = rng.randint(0, len(keys))
+        lower = keys[i - 1] if i > 0 else None
+        upper = keys[i] if i < len(keys) else None
+        keys.insert(i, key_between(lower, upper))
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+
+
+def _apply(keys, changes):
+    return [changes.get(i, key) for i, key in enumerate(keys)]
+
+
+def test_plan_order_keeps_sorted_keys():
+    assert plan_order(["1", "2", "3"]) == {}
+
+
+def test_plan_order_moves_fewest_items():
+    keys = ["2", "3", "4", "1"]
+    changes = plan_order(keys)
+    assert list(changes) == [3]
+    new_keys = _apply(keys, changes)
+    assert new_keys == sorted(new_keys)
+
+
+def test_plan_order_duplicate_keys():
+    keys = ["5", "5", "5", "6"]
+    new_keys = _apply(keys, plan_order(keys))
+    assert new_keys == sorted(new_keys)
+    assert len(set(new_keys)) == len(new_keys)
+
+
+def test_plan_order_null_keys():
+    keys = [None, "5", None, None, "3"]
+    new_keys = _apply(keys, plan_order(keys))
+    assert None not in new_keys
+    assert new_keys == sorted(new_keys)
+    assert len(set(new_keys)) == len(new_keys)